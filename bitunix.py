@@ -1,11 +1,14 @@
+import asyncio
+import functools
 import hashlib
-import json
 import logging
 import time
 import uuid
+from collections import OrderedDict
 from typing import Any
 
 import aiohttp
+import orjson
 
 from db import get_user
 
@@ -13,33 +16,113 @@ from db import get_user
 BITUNIX_BASE_URL = "https://fapi.bitunix.com"
 logger = logging.getLogger(__name__)
 
+_session: aiohttp.ClientSession | None = None
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=100, ttl_dns_cache=300, keepalive_timeout=75
+        )
+        _session = aiohttp.ClientSession(
+            base_url=BITUNIX_BASE_URL,
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=20),
+        )
+    return _session
+
+
+def log_hashlib_backend() -> None:
+    """Registra que backend SHA-256 usa hashlib y avisa si no esta acelerado."""
+    backend = type(hashlib.sha256()).__module__
+    openssl_backed = backend == "_hashlib"
+
+    payload = bytes(1024 * 1024)
+    start = time.perf_counter()
+    hashlib.sha256(payload).digest()
+    elapsed = time.perf_counter() - start
+    mib_per_s = (1.0 / elapsed) if elapsed > 0 else float("inf")
+
+    cpu_has_sha_ni = False
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            cpu_has_sha_ni = "sha_ni" in cpuinfo.read()
+    except OSError:
+        pass
+
+    logger.info(
+        "hashlib sha256: backend=%s openssl=%s throughput=%.0f MiB/s sha_ni=%s",
+        backend,
+        openssl_backed,
+        mib_per_s,
+        cpu_has_sha_ni,
+    )
+    if not openssl_backed or (cpu_has_sha_ni and mib_per_s < 500):
+        logger.warning(
+            "SHA-256 parece no estar acelerado (backend=%s, %.0f MiB/s); "
+            "la firma de requests sera mas lenta de lo esperado.",
+            backend,
+            mib_per_s,
+        )
+
+
+# LRU acotado: /bitunix_test mete timestamps frescos en los params firmados,
+# asi que cada invocacion genera una clave nueva; sin tope el dict creceria
+# de por vida. Las entradas vencidas se conservan como fallback ante errores.
+_RESP_CACHE_TTL = 10.0
+_RESP_CACHE_MAXSIZE = 256
+_resp_cache: OrderedDict[tuple[str, str, str], tuple[float, dict[str, Any]]] = (
+    OrderedDict()
+)
+_resp_cache_lock = asyncio.Lock()
+
+
+async def close_session() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+@functools.lru_cache(maxsize=1024)
+def _canonical_query_cached(items: tuple[tuple[str, str], ...]) -> str:
+    return "".join(f"{key}{value}" for key, value in items)
+
 
 def canonical_query(params: dict | None) -> str:
     if not params:
         return ""
 
-    items = sorted((str(k), "" if v is None else str(v)) for k, v in params.items())
-    return "".join(f"{key}{value}" for key, value in items)
+    items = tuple(
+        sorted((str(k), "" if v is None else str(v)) for k, v in params.items())
+    )
+    return _canonical_query_cached(items)
 
 
 def compact_json(body: dict | None) -> str:
     if body is None:
         return ""
-    return json.dumps(body, separators=(",", ":"))
+    return orjson.dumps(body).decode()
+
+
+# El hash en si ya corre en C (OpenSSL, con SHA-NI donde el CPU lo soporta);
+# solo el pegamento de armado queda en Python, asi que lo mantenemos minimo.
+_sha256 = hashlib.sha256
 
 
 def make_sign(
-    api_key: str,
-    api_secret: str,
-    nonce: str,
-    timestamp: str,
-    query_canon: str,
-    body_str: str,
+    api_key: bytes,
+    api_secret: bytes,
+    nonce: bytes,
+    timestamp: bytes,
+    query_canon: bytes,
+    body: bytes,
 ) -> str:
-    raw = f"{nonce}{timestamp}{api_key}{query_canon}{body_str}"
-    first_hash = hashlib.sha256(raw.encode("utf-8")).hexdigest()
-    final_hash = hashlib.sha256(f"{first_hash}{api_secret}".encode("utf-8")).hexdigest()
-    return final_hash
+    first = _sha256(b"".join((nonce, timestamp, api_key, query_canon, body)))
+    final = _sha256(first.hexdigest().encode())
+    final.update(api_secret)
+    return final.hexdigest()
 
 
 async def bitunix_request(
@@ -48,20 +131,43 @@ async def bitunix_request(
     path: str,
     params: dict | None = None,
     body: dict | None = None,
+    user: dict[str, Any] | None = None,
 ) -> dict[str, Any]:
-    user = await get_user(discord_id)
+    if user is None:
+        user = await get_user(discord_id)
     if user is None:
         raise Exception("Usuario no registrado. Usa /register_bitunix en DM.")
 
     api_key = str(user["api_key"])
     api_secret = str(user["api_secret"])
     method_upper = method.upper()
+    query_canon = canonical_query(params)
+
+    cache_key = (discord_id, path, query_canon)
+    stale_payload: dict[str, Any] | None = None
+    if method_upper == "GET":
+        async with _resp_cache_lock:
+            entry = _resp_cache.get(cache_key)
+            if entry is not None:
+                expires_at, cached_payload = entry
+                if time.monotonic() < expires_at:
+                    _resp_cache.move_to_end(cache_key)
+                    return cached_payload
+                # vencida: no se borra todavia, sirve de fallback si la
+                # request falla; una respuesta fresca la sobreescribe.
+                stale_payload = cached_payload
+
     timestamp = str(int(time.time() * 1000))
     nonce = uuid.uuid4().hex
-
-    query_canon = canonical_query(params)
     body_str = "" if method_upper == "GET" else compact_json(body)
-    sign = make_sign(api_key, api_secret, nonce, timestamp, query_canon, body_str)
+    sign = make_sign(
+        api_key.encode(),
+        api_secret.encode(),
+        nonce.encode(),
+        timestamp.encode(),
+        query_canon.encode(),
+        body_str.encode(),
+    )
 
     headers = {
         "api-key": api_key,
@@ -72,39 +178,64 @@ async def bitunix_request(
     if method_upper != "GET":
         headers["Content-Type"] = "application/json"
 
-    url = f"{BITUNIX_BASE_URL}{path}"
-    logger.info("Bitunix request path=%s params=%s", path, params)
-
-    timeout = aiohttp.ClientTimeout(total=20)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        async with session.request(
-            method_upper,
-            url,
-            params=params,
-            data=body_str if method_upper != "GET" else None,
-            headers=headers,
-        ) as response:
-            logger.info("Bitunix final URL=%s", str(response.url))
-            response_text = await response.text()
-            logger.info("Bitunix HTTP status=%s", response.status)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Bitunix request path=%s params=%s", path, params)
+
+    try:
+        session = await _get_session()
+        if method_upper == "GET":
+            request_ctx = session.get(path, params=params, headers=headers)
+        else:
+            request_ctx = session.request(
+                method_upper, path, params=params, data=body_str, headers=headers
+            )
+        async with request_ctx as response:
+            raw = await response.read()
+            logger.info(
+                "Bitunix %s %s status=%s bytes=%d",
+                method_upper,
+                path,
+                response.status,
+                len(raw),
+            )
 
             if response.status != 200:
-                raise Exception(f"HTTP {response.status}: {response_text[:400]}")
+                detail = raw[:400].decode("utf-8", errors="replace")
+                raise Exception(f"HTTP {response.status}: {detail}")
 
             try:
-                payload = json.loads(response_text)
-            except json.JSONDecodeError as exc:
-                raise Exception(f"JSON invalido: {response_text[:400]}") from exc
-
-    logger.info("Bitunix response JSON=%s", payload)
-
-    if not isinstance(payload, dict):
-        raise Exception("Respuesta inesperada: se esperaba objeto JSON.")
-
-    code = payload.get("code")
-    if code != 0 and code != "0":
-        msg = payload.get("msg") or payload.get("message") or "Sin detalle"
-        raise Exception(f"Bitunix code={code}, msg={msg}")
+                payload = orjson.loads(raw)
+            except orjson.JSONDecodeError as exc:
+                detail = raw[:400].decode("utf-8", errors="replace")
+                raise Exception(f"JSON invalido: {detail}") from exc
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Bitunix response JSON=%s", payload)
+
+        if not isinstance(payload, dict):
+            raise Exception("Respuesta inesperada: se esperaba objeto JSON.")
+
+        code = payload.get("code")
+        if code != 0 and code != "0":
+            msg = payload.get("msg") or payload.get("message") or "Sin detalle"
+            raise Exception(f"Bitunix code={code}, msg={msg}")
+    except Exception as exc:
+        if stale_payload is not None:
+            logger.warning(
+                "Bitunix %s %s fallo (%s); sirviendo payload cacheado vencido",
+                method_upper,
+                path,
+                exc,
+            )
+            return stale_payload
+        raise
+
+    if method_upper == "GET":
+        async with _resp_cache_lock:
+            _resp_cache[cache_key] = (time.monotonic() + _RESP_CACHE_TTL, payload)
+            _resp_cache.move_to_end(cache_key)
+            while len(_resp_cache) > _RESP_CACHE_MAXSIZE:
+                _resp_cache.popitem(last=False)
 
     return payload
 
@@ -124,7 +255,11 @@ def _to_int(value: Any, default: int = 0) -> int:
 
 
 async def fetch_user_trades(
-    discord_id: str, symbol: str | None = None, limit: int = 50, skip: int = 0
+    discord_id: str,
+    symbol: str | None = None,
+    limit: int = 50,
+    skip: int = 0,
+    user: dict[str, Any] | None = None,
 ) -> tuple[int, list[dict[str, Any]]]:
     safe_limit = max(1, min(limit, 100))
     params: dict[str, Any] = {"limit": safe_limit, "skip": max(0, skip)}
@@ -136,6 +271,7 @@ async def fetch_user_trades(
         method="GET",
         path="/api/v1/futures/trade/get_history_trades",
         params=params,
+        user=user,
     )
 
     code = response.get("code")
@@ -150,27 +286,77 @@ async def fetch_user_trades(
         if isinstance(raw_trade_list, list):
             trade_list = raw_trade_list
 
-    normalized: list[dict[str, Any]] = []
-    for item in trade_list:
-        if not isinstance(item, dict):
-            continue
-
-        trade_id_val = item.get("tradeId")
-        if trade_id_val is None:
-            continue
-
-        normalized.append(
-            {
-                "trade_id": str(trade_id_val),
-                "symbol": str(item.get("symbol", "")),
-                "timestamp_ms": _to_int(item.get("ctime"), 0),
-                "side": str(item.get("side", "")),
-                "qty": _to_float(item.get("qty"), 0.0),
-                "price": _to_float(item.get("price"), 0.0),
-                "realized_pnl": _to_float(item.get("realizedPNL"), 0.0),
-                "fee": _to_float(item.get("fee"), 0.0),
-                "raw_json": json.dumps(item, separators=(",", ":")),
-            }
-        )
+    normalized: list[dict[str, Any]] = [
+        {
+            "trade_id": str(trade_id_val),
+            "symbol": str(g("symbol", "")),
+            "timestamp_ms": _to_int(g("ctime"), 0),
+            "side": str(g("side", "")),
+            "qty": _to_float(g("qty"), 0.0),
+            "price": _to_float(g("price"), 0.0),
+            "realized_pnl": _to_float(g("realizedPNL"), 0.0),
+            "fee": _to_float(g("fee"), 0.0),
+            "raw_json": orjson.dumps(item),
+        }
+        for item in trade_list
+        if isinstance(item, dict)
+        for g in (item.get,)
+        for trade_id_val in (g("tradeId"),)
+        if trade_id_val is not None
+    ]
 
     return len(normalized), normalized
+
+
+async def fetch_all_trades(
+    discord_id: str,
+    symbol: str | None = None,
+    page_size: int = 100,
+    max_pages: int = 20,
+    user: dict[str, Any] | None = None,
+) -> tuple[int, list[dict[str, Any]]]:
+    """Pagina get_history_trades en ventanas concurrentes de hasta 5 requests
+    y corta en cuanto una pagina llega incompleta. Dedup por trade_id."""
+    safe_page_size = max(1, min(page_size, 100))
+    concurrency = 5
+
+    seen: set[str] = set()
+    collected: list[dict[str, Any]] = []
+    page = 0
+    exhausted = False
+
+    while page < max_pages and not exhausted:
+        window = range(page, min(page + concurrency, max_pages))
+        results = await asyncio.gather(
+            *(
+                fetch_user_trades(
+                    discord_id=discord_id,
+                    symbol=symbol,
+                    limit=safe_page_size,
+                    skip=i * safe_page_size,
+                    user=user,
+                )
+                for i in window
+            ),
+            return_exceptions=True,
+        )
+
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.warning("Error paginando trades: %s", result)
+                exhausted = True
+                continue
+
+            fetched_count, trades = result
+            if fetched_count < safe_page_size:
+                exhausted = True
+
+            for trade in trades:
+                trade_id = trade["trade_id"]
+                if trade_id not in seen:
+                    seen.add(trade_id)
+                    collected.append(trade)
+
+        page += concurrency
+
+    return len(collected), collected
@@ -2,15 +2,20 @@ import logging
 import os
 import sys
 import time
-from datetime import datetime
 
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 
-from bitunix import bitunix_request, fetch_user_trades
+from bitunix import (
+    bitunix_request,
+    close_session,
+    fetch_all_trades,
+    log_hashlib_backend,
+)
 from db import (
     add_note,
+    close_db,
     delete_user,
     get_user,
     init_db,
@@ -24,6 +29,28 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+_ROW_FMT = "{ts} | {symbol} {side} | pnl={pnl} fee={fee} | id={tid} | nota={note}"
+
+
+def _dash(value: object) -> object:
+    return value if value not in (None, "") else "-"
+
+
+def _format_trade_line(trade: dict) -> str:
+    ts = int(trade.get("timestamp_ms") or 0)
+    return _ROW_FMT.format_map(
+        {
+            "ts": time.strftime("%Y-%m-%d %H:%M", time.localtime(ts // 1000)),
+            "symbol": _dash(trade.get("symbol")),
+            "side": _dash(trade.get("side")),
+            "pnl": trade.get("realized_pnl") or 0,
+            "fee": trade.get("fee") or 0,
+            "tid": trade.get("trade_id"),
+            "note": _dash(trade.get("note")),
+        }
+    )
+
+
 def build_bot(enable_members_intent: bool) -> commands.Bot:
     intents = discord.Intents.none()
     intents.guilds = True
@@ -31,6 +58,21 @@ def build_bot(enable_members_intent: bool) -> commands.Bot:
 
     bot = commands.Bot(command_prefix="!", intents=intents)
 
+    original_close = bot.close
+
+    async def close_with_cleanup() -> None:
+        try:
+            await close_session()
+        except Exception:
+            logger.exception("Error cerrando la sesion HTTP de Bitunix")
+        try:
+            await close_db()
+        except Exception:
+            logger.exception("Error cerrando la base de datos")
+        await original_close()
+
+    bot.close = close_with_cleanup  # type: ignore[method-assign]
+
     @bot.event
     async def on_ready() -> None:
         print(f"Bot conectado como {bot.user}")
@@ -112,6 +154,8 @@ def build_bot(enable_members_intent: bool) -> commands.Bot:
             return
 
         discord_id = str(interaction.user.id)
+        now_ms = time.time_ns() // 1_000_000
+        start_ms = now_ms - 7 * 86_400_000
 
         try:
             user = await get_user(discord_id)
@@ -129,9 +173,10 @@ def build_bot(enable_members_intent: bool) -> commands.Bot:
                     "symbol": "BTCUSDT",
                     "limit": 1,
                     "skip": 0,
-                    "startTime": int(time.time() * 1000) - (7 * 24 * 60 * 60 * 1000),
-                    "endTime": int(time.time() * 1000),
+                    "startTime": start_ms,
+                    "endTime": now_ms,
                 },
+                user=user,
             )
             await interaction.response.send_message("OK: respuesta recibida")
         except Exception as exc:
@@ -158,8 +203,8 @@ def build_bot(enable_members_intent: bool) -> commands.Bot:
                 )
                 return
 
-            fetched_count, trades = await fetch_user_trades(
-                discord_id=discord_id, symbol=symbol, limit=safe_limit, skip=0
+            fetched_count, trades = await fetch_all_trades(
+                discord_id=discord_id, symbol=symbol, page_size=safe_limit, user=user
             )
             inserted_count = await insert_trades(discord_id=discord_id, trades=trades)
 
@@ -239,8 +284,8 @@ def build_bot(enable_members_intent: bool) -> commands.Bot:
         safe_page = max(1, page)
         page_size = 10
         offset = (safe_page - 1) * page_size
-        now_ms = int(time.time() * 1000)
-        since_ms = now_ms - (safe_days * 86400000)
+        now_ms = time.time_ns() // 1_000_000
+        since_ms = now_ms - (safe_days * 86_400_000)
 
         try:
             trades, total = await list_trades(
@@ -257,17 +302,7 @@ def build_bot(enable_members_intent: bool) -> commands.Bot:
                 )
                 return
 
-            lines: list[str] = []
-            for trade in trades:
-                ts = int(trade.get("timestamp_ms") or 0)
-                date_str = datetime.fromtimestamp(ts / 1000).strftime("%Y-%m-%d %H:%M")
-                line = (
-                    f"{date_str} | {trade.get('symbol') or '-'} {trade.get('side') or '-'}"
-                    f" | pnl={trade.get('realized_pnl') or 0} fee={trade.get('fee') or 0}"
-                    f" | id={trade.get('trade_id')}"
-                    f" | nota={trade.get('note') or '-'}"
-                )
-                lines.append(line)
+            description = "\n".join(_format_trade_line(trade) for trade in trades)
 
             title = f"Tu Journal - últimos {safe_days} días"
             if symbol:
@@ -275,7 +310,7 @@ def build_bot(enable_members_intent: bool) -> commands.Bot:
 
             embed = discord.Embed(
                 title=title,
-                description="\n".join(lines),
+                description=description,
                 color=discord.Color.blue(),
             )
             embed.set_footer(
@@ -299,6 +334,14 @@ def build_bot(enable_members_intent: bool) -> commands.Bot:
 
 
 def main() -> None:
+    try:
+        import uvloop
+    except ImportError:
+        logger.info("uvloop no disponible; usando el event loop estandar")
+    else:
+        uvloop.install()
+        logger.info("uvloop instalado como event loop")
+
     load_dotenv()
     token = os.getenv("DISCORD_TOKEN")
     enable_members_intent = (
@@ -318,6 +361,8 @@ def main() -> None:
             "DISCORD_MEMBERS_INTENT=false. El bot arrancara sin intent privilegiado de members."
         )
 
+    log_hashlib_backend()
+
     bot = build_bot(enable_members_intent=enable_members_intent)
     bot.run(token)
 
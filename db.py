@@ -1,45 +1,342 @@
+"""Capa de acceso a SQLite (aiosqlite) para usuarios y trades.
+
+Cada operacion rebota por el worker thread de aiosqlite via futures, asi que
+un event loop mas rapido reduce la latencia por llamada: el entrypoint del
+bot instala uvloop cuando esta disponible.
+"""
+
+import asyncio
+import contextlib
+import os
 import time
-from typing import Any, Optional
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from typing import Any, Final, Optional
 
 import aiosqlite
+import zstandard
 
 
 DEFAULT_DB_PATH = "trading_journal.db"
 
+# SQL estable a nivel de modulo: pasar siempre el mismo literal maximiza los
+# hits del statement cache de sqlite3 en la conexion compartida.
+_INIT_DDL: Final[str] = """
+    CREATE TABLE IF NOT EXISTS users (
+        discord_id TEXT PRIMARY KEY,
+        api_key TEXT NOT NULL,
+        api_secret TEXT NOT NULL,
+        created_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL
+    );
 
-async def init_db(db_path: str = DEFAULT_DB_PATH) -> None:
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                discord_id TEXT PRIMARY KEY,
-                api_key TEXT NOT NULL,
-                api_secret TEXT NOT NULL,
-                created_at INTEGER NOT NULL,
-                updated_at INTEGER NOT NULL
-            )
-            """
+    CREATE TABLE IF NOT EXISTS symbols (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS sides (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    );
+
+    INSERT OR IGNORE INTO sides (name) VALUES ('BUY'), ('SELL');
+
+    CREATE TABLE IF NOT EXISTS trades (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_discord_id TEXT NOT NULL,
+        trade_id TEXT NOT NULL,
+        symbol_id INTEGER REFERENCES symbols(id),
+        timestamp_ms INTEGER,
+        side_id INTEGER REFERENCES sides(id),
+        qty REAL,
+        price REAL,
+        realized_pnl REAL,
+        fee REAL,
+        note TEXT,
+        raw_json BLOB,
+        UNIQUE(user_discord_id, trade_id)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_trades_user_ts
+    ON trades(user_discord_id, timestamp_ms);
+"""
+
+_UPSERT_USER_SQL: Final[str] = """
+    INSERT INTO users (discord_id, api_key, api_secret, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(discord_id) DO UPDATE SET
+        api_key=excluded.api_key,
+        api_secret=excluded.api_secret,
+        updated_at=excluded.updated_at
+"""
+
+_SELECT_USER_SQL: Final[str] = """
+    SELECT discord_id, api_key, api_secret, created_at, updated_at
+    FROM users
+    WHERE discord_id = ?
+"""
+
+_DELETE_USER_SQL: Final[str] = """
+    DELETE FROM users
+    WHERE discord_id = ?
+"""
+
+_INSERT_TRADE_SQL: Final[str] = """
+    INSERT OR IGNORE INTO trades (
+        user_discord_id,
+        trade_id,
+        symbol_id,
+        timestamp_ms,
+        side_id,
+        qty,
+        price,
+        realized_pnl,
+        fee,
+        raw_json
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_INSERT_CHUNK_SIZE = 10_000
+
+# Campos que pasan tal cual del trade normalizado a la fila (en orden de
+# columnas del INSERT, entre side_id y raw_json).
+_TRADE_PASSTHROUGH_FIELDS: Final[tuple[str, ...]] = (
+    "qty",
+    "price",
+    "realized_pnl",
+    "fee",
+)
+
+_INSERT_SYMBOL_SQL: Final[str] = "INSERT OR IGNORE INTO symbols (name) VALUES (?)"
+_SELECT_SYMBOL_ID_SQL: Final[str] = "SELECT id FROM symbols WHERE name = ?"
+_INSERT_SIDE_SQL: Final[str] = "INSERT OR IGNORE INTO sides (name) VALUES (?)"
+_SELECT_SIDE_ID_SQL: Final[str] = "SELECT id FROM sides WHERE name = ?"
+
+_SELECT_TRADE_RAW_SQL: Final[str] = """
+    SELECT raw_json
+    FROM trades
+    WHERE user_discord_id = ? AND trade_id = ?
+"""
+
+_ADD_NOTE_SQL: Final[str] = """
+    UPDATE trades
+    SET note = ?
+    WHERE user_discord_id = ? AND trade_id = ?
+"""
+
+# Migracion one-shot para bases creadas antes de la codificacion por
+# diccionario (trades.symbol/side como TEXT): agrega las columnas de ids
+# y las rellena desde el texto existente. Se ejecuta dentro de una
+# transaccion desde init_db.
+_LEGACY_TRADES_MIGRATION: Final[tuple[str, ...]] = (
+    "ALTER TABLE trades ADD COLUMN symbol_id INTEGER REFERENCES symbols(id)",
+    "ALTER TABLE trades ADD COLUMN side_id INTEGER REFERENCES sides(id)",
+    """
+    INSERT OR IGNORE INTO symbols (name)
+    SELECT DISTINCT symbol FROM trades
+    WHERE symbol IS NOT NULL AND symbol != ''
+    """,
+    """
+    INSERT OR IGNORE INTO sides (name)
+    SELECT DISTINCT side FROM trades
+    WHERE side IS NOT NULL AND side != ''
+    """,
+    """
+    UPDATE trades
+    SET symbol_id = (SELECT id FROM symbols WHERE name = trades.symbol)
+    WHERE symbol IS NOT NULL AND symbol != ''
+    """,
+    """
+    UPDATE trades
+    SET side_id = (SELECT id FROM sides WHERE name = trades.side)
+    WHERE side IS NOT NULL AND side != ''
+    """,
+)
+
+_connections: dict[str, aiosqlite.Connection] = {}
+_write_lock = asyncio.Lock()
+
+
+async def _get_conn(db_path: str) -> aiosqlite.Connection:
+    conn = _connections.get(db_path)
+    if conn is None:
+        # isolation_level=None: autocommit, sin BEGIN implicitos del modulo
+        # sqlite3; las transacciones explicitas las manejamos nosotros.
+        conn = await aiosqlite.connect(
+            db_path, isolation_level=None, cached_statements=128
         )
-        await db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_discord_id TEXT NOT NULL,
-                trade_id TEXT NOT NULL,
-                symbol TEXT,
-                timestamp_ms INTEGER,
-                side TEXT,
-                qty REAL,
-                price REAL,
-                realized_pnl REAL,
-                fee REAL,
-                note TEXT,
-                raw_json TEXT,
-                UNIQUE(user_discord_id, trade_id)
+        conn.row_factory = aiosqlite.Row
+        if db_path != ":memory:":
+            # page_size solo afecta bases nuevas (antes del primer CREATE);
+            # en bases existentes es un no-op salvo VACUUM posterior.
+            await conn.execute("PRAGMA page_size=8192")
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA mmap_size=268435456")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        await conn.execute("PRAGMA cache_size=-64000")
+        await conn.execute("PRAGMA busy_timeout=5000")
+        _connections[db_path] = conn
+    return conn
+
+
+# WAL permite N lectores concurrentes con un escritor: la conexion
+# compartida queda como escritora y las lecturas toman una conexion
+# query_only de este pool, asi un batch de insert no bloquea los SELECT.
+_READER_POOL_SIZE = 4
+_reader_pools: dict[str, asyncio.Queue] = {}
+
+
+async def _get_reader_pool(db_path: str) -> asyncio.Queue:
+    pool = _reader_pools.get(db_path)
+    if pool is None:
+        await _get_conn(db_path)  # crea la base y activa WAL primero
+        pool = asyncio.Queue(maxsize=_READER_POOL_SIZE)
+        _reader_pools[db_path] = pool
+        for _ in range(_READER_POOL_SIZE):
+            conn = await aiosqlite.connect(
+                db_path, isolation_level=None, cached_statements=128
             )
-            """
+            conn.row_factory = aiosqlite.Row
+            await conn.execute("PRAGMA busy_timeout=5000")
+            await conn.execute("PRAGMA mmap_size=268435456")
+            await conn.execute("PRAGMA query_only=1")
+            pool.put_nowait(conn)
+    return pool
+
+
+@contextlib.asynccontextmanager
+async def _reader(db_path: str) -> AsyncIterator[aiosqlite.Connection]:
+    if db_path == ":memory:":
+        # cada conexion :memory: es una base distinta; usar la compartida
+        yield await _get_conn(db_path)
+        return
+
+    pool = await _get_reader_pool(db_path)
+    conn = await pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put_nowait(conn)
+
+
+async def close_db() -> None:
+    for conn in list(_connections.values()):
+        try:
+            await conn.execute("PRAGMA optimize")
+        except Exception:
+            pass
+        await conn.close()
+    _connections.clear()
+    _symbol_id_cache.clear()
+    _side_id_cache.clear()
+    _user_cache.clear()
+    for pool in _reader_pools.values():
+        while not pool.empty():
+            await pool.get_nowait().close()
+    _reader_pools.clear()
+
+
+# raw_json se guarda comprimido (zstd nivel 3): el payload crudo del exchange
+# domina el tamano de la tabla y comprime 5-10x. Un solo compresor/
+# descompresor se reutiliza entre filas.
+#
+# Si existe trades.zdict (diccionario entrenado offline con
+# `zstd --train samples/*.json -o trades.zdict`), se usa: los payloads de
+# trades comparten casi todo el vocabulario y el diccionario suma 2-3x extra
+# en registros chicos. No borrar el archivo una vez que hay filas escritas
+# con el: esas filas lo necesitan para descomprimir.
+_ZSTD_DICT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trades.zdict")
+
+try:
+    with open(_ZSTD_DICT_PATH, "rb") as _dict_file:
+        _zstd_dict: zstandard.ZstdCompressionDict | None = (
+            zstandard.ZstdCompressionDict(_dict_file.read())
         )
-        await db.commit()
+except OSError:
+    _zstd_dict = None
+
+if _zstd_dict is not None:
+    _zstd_compressor = zstandard.ZstdCompressor(level=3, dict_data=_zstd_dict)
+    _zstd_decompressor = zstandard.ZstdDecompressor(dict_data=_zstd_dict)
+else:
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+
+
+def _compress_raw(value: str | bytes | None) -> bytes | None:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.encode()
+    return _zstd_compressor.compress(value)
+
+
+# Codificacion por diccionario: symbol/side van como ids enteros contra las
+# tablas de lookup; el mapeo name->id se cachea en memoria por base.
+_symbol_id_cache: dict[tuple[str, str], int] = {}
+_side_id_cache: dict[tuple[str, str], int] = {}
+
+
+async def _name_to_id(
+    db: aiosqlite.Connection,
+    db_path: str,
+    name: str,
+    cache: dict[tuple[str, str], int],
+    insert_sql: str,
+    select_sql: str,
+) -> int:
+    key = (db_path, name)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    await db.execute(insert_sql, (name,))
+    async with db.execute(select_sql, (name,)) as cursor:
+        row = await cursor.fetchone()
+
+    name_id = int(row[0])
+    cache[key] = name_id
+    return name_id
+
+
+_USER_CACHE_TTL = 60.0
+_USER_CACHE_MAXSIZE = 10_000
+# Clave (db_path, discord_id), igual que los caches de symbol/side: el mismo
+# discord_id puede existir en bases distintas con credenciales distintas.
+_user_cache: OrderedDict[tuple[str, str], tuple[float, dict[str, str | int]]] = (
+    OrderedDict()
+)
+
+
+async def init_db(db_path: str = DEFAULT_DB_PATH) -> None:
+    db = await _get_conn(db_path)
+    async with _write_lock:
+        # executescript manda todo el DDL en un solo viaje y comitea implicito
+        await db.executescript(_INIT_DDL)
+        await _migrate_legacy_trades(db)
+
+
+async def _migrate_legacy_trades(db: aiosqlite.Connection) -> None:
+    """Migra una base con el esquema viejo de trades (symbol/side TEXT) al
+    esquema con symbol_id/side_id. Las columnas de texto quedan en su lugar
+    (quitarlas exige reescribir la tabla); las filas nuevas las dejan NULL y
+    las lecturas ya no las usan."""
+    async with db.execute("PRAGMA table_info(trades)") as cursor:
+        columns = {row["name"] for row in await cursor.fetchall()}
+    if "symbol_id" in columns or "symbol" not in columns:
+        return
+
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        for statement in _LEGACY_TRADES_MIGRATION:
+            await db.execute(statement)
+    except BaseException:
+        await db.execute("ROLLBACK")
+        raise
+    await db.commit()
 
 
 async def upsert_user(
@@ -47,119 +344,180 @@ async def upsert_user(
     api_key: str,
     api_secret: str,
     db_path: str = DEFAULT_DB_PATH,
+    now_ts: int | None = None,
 ) -> None:
-    now = int(time.time())
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute(
-            """
-            INSERT INTO users (discord_id, api_key, api_secret, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(discord_id) DO UPDATE SET
-                api_key=excluded.api_key,
-                api_secret=excluded.api_secret,
-                updated_at=excluded.updated_at
-            """,
-            (discord_id, api_key, api_secret, now, now),
-        )
+    """Crea o actualiza un usuario. Los llamadores que refrescan varios
+    usuarios pueden calcular now_ts una sola vez y pasarlo a cada llamada."""
+    now = int(time.time()) if now_ts is None else now_ts
+    db = await _get_conn(db_path)
+    async with _write_lock:
+        await db.execute(_UPSERT_USER_SQL, (discord_id, api_key, api_secret, now, now))
+        await db.commit()
+
+    _user_cache.pop((db_path, discord_id), None)
+
+
+async def upsert_users(
+    users: list[tuple[str, str, str]],
+    db_path: str = DEFAULT_DB_PATH,
+    now_ts: int | None = None,
+) -> None:
+    """Upsert de varios usuarios (discord_id, api_key, api_secret) en una
+    sola transaccion: un commit/fsync para todo el lote."""
+    if not users:
+        return
+
+    now = int(time.time()) if now_ts is None else now_ts
+    rows = [
+        (discord_id, api_key, api_secret, now, now)
+        for discord_id, api_key, api_secret in users
+    ]
+
+    db = await _get_conn(db_path)
+    async with _write_lock:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            await db.executemany(_UPSERT_USER_SQL, rows)
+        except BaseException:
+            await db.execute("ROLLBACK")
+            raise
         await db.commit()
 
+    for discord_id, _, _ in users:
+        _user_cache.pop((db_path, discord_id), None)
+
 
 async def get_user(
     discord_id: str, db_path: str = DEFAULT_DB_PATH
 ) -> Optional[dict[str, str | int]]:
-    async with aiosqlite.connect(db_path) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            """
-            SELECT discord_id, api_key, api_secret, created_at, updated_at
-            FROM users
-            WHERE discord_id = ?
-            """,
-            (discord_id,),
-        ) as cursor:
+    """Busca un usuario; los hits recientes se sirven desde el cache TTL+LRU
+    sin tocar SQLite. upsert_user/delete_user invalidan la entrada."""
+    cache_key = (db_path, discord_id)
+    entry = _user_cache.get(cache_key)
+    if entry is not None:
+        stored_at, cached_user = entry
+        if time.monotonic() - stored_at < _USER_CACHE_TTL:
+            _user_cache.move_to_end(cache_key)
+            return dict(cached_user)
+        _user_cache.pop(cache_key, None)
+
+    async with _reader(db_path) as rdb:
+        async with rdb.execute(_SELECT_USER_SQL, (discord_id,)) as cursor:
             row = await cursor.fetchone()
 
     if row is None:
         return None
 
-    return {
-        "discord_id": row["discord_id"],
-        "api_key": row["api_key"],
-        "api_secret": row["api_secret"],
-        "created_at": row["created_at"],
-        "updated_at": row["updated_at"],
+    discord_id_val, api_key, api_secret, created_at, updated_at = row
+    user: dict[str, str | int] = {
+        "discord_id": discord_id_val,
+        "api_key": api_key,
+        "api_secret": api_secret,
+        "created_at": created_at,
+        "updated_at": updated_at,
     }
 
+    _user_cache[cache_key] = (time.monotonic(), dict(user))
+    _user_cache.move_to_end(cache_key)
+    while len(_user_cache) > _USER_CACHE_MAXSIZE:
+        _user_cache.popitem(last=False)
+
+    return user
+
 
 async def delete_user(discord_id: str, db_path: str = DEFAULT_DB_PATH) -> None:
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute(
-            """
-            DELETE FROM users
-            WHERE discord_id = ?
-            """,
-            (discord_id,),
-        )
+    db = await _get_conn(db_path)
+    async with _write_lock:
+        await db.execute(_DELETE_USER_SQL, (discord_id,))
         await db.commit()
 
+    _user_cache.pop((db_path, discord_id), None)
+
 
 async def insert_trades(
     discord_id: str, trades: list[dict[str, Any]], db_path: str = DEFAULT_DB_PATH
 ) -> int:
+    """Inserta trades en lote; la dedup la hace SQLite via
+    UNIQUE(user_discord_id, trade_id) + INSERT OR IGNORE, sin SELECT previo.
+    Devuelve cuantas filas se insertaron realmente.
+
+    raw_json puede venir como bytes (preferido: orjson.dumps ya los emite,
+    y la compresion trabaja sobre bytes) o como str."""
     if not trades:
         return 0
 
-    inserted = 0
-    async with aiosqlite.connect(db_path) as db:
+    db = await _get_conn(db_path)
+    async with _write_lock:
+        symbol_ids: dict[str | None, int | None] = {None: None}
+        side_ids: dict[str | None, int | None] = {None: None}
         for trade in trades:
-            cursor = await db.execute(
-                """
-                INSERT OR IGNORE INTO trades (
-                    user_discord_id,
-                    trade_id,
-                    symbol,
-                    timestamp_ms,
-                    side,
-                    qty,
-                    price,
-                    realized_pnl,
-                    fee,
-                    raw_json
+            symbol = trade.get("symbol") or None
+            if symbol not in symbol_ids:
+                symbol_ids[symbol] = await _name_to_id(
+                    db, db_path, symbol, _symbol_id_cache,
+                    _INSERT_SYMBOL_SQL, _SELECT_SYMBOL_ID_SQL,
+                )
+            side = trade.get("side") or None
+            if side not in side_ids:
+                side_ids[side] = await _name_to_id(
+                    db, db_path, side, _side_id_cache,
+                    _INSERT_SIDE_SQL, _SELECT_SIDE_ID_SQL,
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    discord_id,
-                    trade["trade_id"],
-                    trade.get("symbol"),
-                    trade.get("timestamp_ms"),
-                    trade.get("side"),
-                    trade.get("qty"),
-                    trade.get("price"),
-                    trade.get("realized_pnl"),
-                    trade.get("fee"),
-                    trade.get("raw_json"),
-                ),
+
+        def _row(trade: dict[str, Any]) -> tuple:
+            g = trade.get
+            return (
+                discord_id,
+                trade["trade_id"],
+                symbol_ids[g("symbol") or None],
+                g("timestamp_ms"),
+                side_ids[g("side") or None],
+                *(g(field) for field in _TRADE_PASSTHROUGH_FIELDS),
+                _compress_raw(g("raw_json")),
             )
-            inserted += max(cursor.rowcount, 0)
 
+        changes_before = db.total_changes
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            # generador por chunk: sqlite3 itera los parametros una sola vez,
+            # asi nunca materializamos todas las filas (blobs incluidos).
+            for start in range(0, len(trades), _INSERT_CHUNK_SIZE):
+                chunk = trades[start : start + _INSERT_CHUNK_SIZE]
+                await db.executemany(
+                    _INSERT_TRADE_SQL, (_row(trade) for trade in chunk)
+                )
+        except BaseException:
+            await db.execute("ROLLBACK")
+            raise
         await db.commit()
+        inserted = db.total_changes - changes_before
 
     return inserted
 
 
+async def get_trade_raw(
+    discord_id: str, trade_id: str, db_path: str = DEFAULT_DB_PATH
+) -> Optional[str]:
+    """Devuelve el payload crudo (JSON) de un trade, descomprimido."""
+    async with _reader(db_path) as rdb:
+        async with rdb.execute(_SELECT_TRADE_RAW_SQL, (discord_id, trade_id)) as cursor:
+            row = await cursor.fetchone()
+
+    if row is None or row[0] is None:
+        return None
+
+    blob = row[0]
+    if isinstance(blob, str):  # filas viejas sin comprimir
+        return blob
+    return _zstd_decompressor.decompress(blob).decode()
+
+
 async def add_note(
     discord_id: str, trade_id: str, note: str, db_path: str = DEFAULT_DB_PATH
 ) -> bool:
-    async with aiosqlite.connect(db_path) as db:
-        cursor = await db.execute(
-            """
-            UPDATE trades
-            SET note = ?
-            WHERE user_discord_id = ? AND trade_id = ?
-            """,
-            (note, discord_id, trade_id),
-        )
+    db = await _get_conn(db_path)
+    async with _write_lock:
+        cursor = await db.execute(_ADD_NOTE_SQL, (note, discord_id, trade_id))
         await db.commit()
         return max(cursor.rowcount, 0) > 0
 
@@ -172,51 +530,55 @@ async def list_trades(
     symbol: str | None = None,
     db_path: str = DEFAULT_DB_PATH,
 ) -> tuple[list[dict[str, Any]], int]:
-    async with aiosqlite.connect(db_path) as db:
-        db.row_factory = aiosqlite.Row
-
-        if symbol:
-            count_sql = """
-                SELECT COUNT(*) AS total
-                FROM trades
-                WHERE user_discord_id = ?
-                  AND timestamp_ms >= ?
-                  AND symbol = ?
-            """
-            rows_sql = """
-                SELECT trade_id, symbol, timestamp_ms, side, realized_pnl, fee, note
-                FROM trades
-                WHERE user_discord_id = ?
-                  AND timestamp_ms >= ?
-                  AND symbol = ?
-                ORDER BY timestamp_ms DESC
-                LIMIT ? OFFSET ?
-            """
-            count_params = (discord_id, since_ms, symbol)
-            row_params = (discord_id, since_ms, symbol, limit, offset)
-        else:
-            count_sql = """
-                SELECT COUNT(*) AS total
-                FROM trades
-                WHERE user_discord_id = ?
-                  AND timestamp_ms >= ?
-            """
-            rows_sql = """
-                SELECT trade_id, symbol, timestamp_ms, side, realized_pnl, fee, note
-                FROM trades
-                WHERE user_discord_id = ?
-                  AND timestamp_ms >= ?
-                ORDER BY timestamp_ms DESC
-                LIMIT ? OFFSET ?
-            """
-            count_params = (discord_id, since_ms)
-            row_params = (discord_id, since_ms, limit, offset)
-
-        async with db.execute(count_sql, count_params) as count_cursor:
+    if symbol:
+        count_sql = """
+            SELECT COUNT(*) AS total
+            FROM trades
+            WHERE user_discord_id = ?
+              AND timestamp_ms >= ?
+              AND symbol_id = (SELECT id FROM symbols WHERE name = ?)
+        """
+        rows_sql = """
+            SELECT t.trade_id, s.name AS symbol, t.timestamp_ms,
+                   sd.name AS side, t.realized_pnl, t.fee, t.note
+            FROM trades t
+            LEFT JOIN symbols s ON s.id = t.symbol_id
+            LEFT JOIN sides sd ON sd.id = t.side_id
+            WHERE t.user_discord_id = ?
+              AND t.timestamp_ms >= ?
+              AND t.symbol_id = (SELECT id FROM symbols WHERE name = ?)
+            ORDER BY t.timestamp_ms DESC
+            LIMIT ? OFFSET ?
+        """
+        count_params = (discord_id, since_ms, symbol)
+        row_params = (discord_id, since_ms, symbol, limit, offset)
+    else:
+        count_sql = """
+            SELECT COUNT(*) AS total
+            FROM trades
+            WHERE user_discord_id = ?
+              AND timestamp_ms >= ?
+        """
+        rows_sql = """
+            SELECT t.trade_id, s.name AS symbol, t.timestamp_ms,
+                   sd.name AS side, t.realized_pnl, t.fee, t.note
+            FROM trades t
+            LEFT JOIN symbols s ON s.id = t.symbol_id
+            LEFT JOIN sides sd ON sd.id = t.side_id
+            WHERE t.user_discord_id = ?
+              AND t.timestamp_ms >= ?
+            ORDER BY t.timestamp_ms DESC
+            LIMIT ? OFFSET ?
+        """
+        count_params = (discord_id, since_ms)
+        row_params = (discord_id, since_ms, limit, offset)
+
+    async with _reader(db_path) as rdb:
+        async with rdb.execute(count_sql, count_params) as count_cursor:
             count_row = await count_cursor.fetchone()
             total = int(count_row["total"]) if count_row is not None else 0
 
-        async with db.execute(rows_sql, row_params) as rows_cursor:
+        async with rdb.execute(rows_sql, row_params) as rows_cursor:
             rows = await rows_cursor.fetchall()
 
     trades: list[dict[str, Any]] = []